@@ -22,16 +22,64 @@ Recipe JSON format (object):
 """
 
 import argparse
+import heapq
 import json
+import math
 import os
-from itertools import combinations
+import re
+import warnings
+from collections import namedtuple
+from functools import lru_cache
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+
+# numba is optional, and importing it and loading its kernel cache takes about half a second,
+# longer than a small search takes in plain Python. The kernels below therefore start out as
+# plain Python functions, and only a search over at least JIT_MIN_COMBOS combos swaps in their
+# compiled versions (see _use_compiled_kernels).
+_kernel_options = {}
+
+
+def _kernel(**options):
+    # register a search kernel and the numba options to compile it with
+    def register(func):
+        _kernel_options[func.__name__] = options
+        return func
+    return register
+
+# Compositions and recipe bounds are searched as integers in units of 1/COMP_SCALE
+COMP_SCALE = 10000
+# Score weights are integers in units of 1/WEIGHT_SCALE
+WEIGHT_SCALE = 2
+# Largest target window (in mass units) the kernel builds a reachable-total table for
+REACH_LIMIT_UNITS = 1 << 20
+# Fewest combos for which a search compiles its kernels with numba (when installed); a plain
+# Python kernel takes roughly 10-30 ms per combo on the shipped inventory
+JIT_MIN_COMBOS = 64
+
+# Struct-of-arrays view of an item list: names, masses, availability, a dense (n_items, n_elements)
+# composition matrix whose columns follow the recipe elements, and the composition dicts for display
+Inventory = namedtuple('Inventory', ['names', 'masses', 'available', 'comp_mat', 'comps'])
+
+# One inline recipe entry, e.g. "Cu:0.50-0.65"
+_RECIPE_RE = re.compile(r'\s*([^\s:;]+)\s*:\s*(\d+(?:\.\d*)?|\.\d+)\s*-\s*(\d+(?:\.\d*)?|\.\d+)\s*')
 
 
 def load_items(path):
     if not path or not os.path.exists(path):
         return []
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    # callers extend the list (e.g. --add-item), so hand out copies of the cached records
+    st = os.stat(path)
+    return [dict(it) for it in _load_items_cached(path, st.st_mtime_ns, st.st_size)]
+
+
+@lru_cache(maxsize=8)
+def _load_items_cached(path, mtime_ns, size):
+    # keyed on the modification time and size so an edited inventory is re-read, even when the
+    # edit lands within the filesystem's timestamp resolution
+    data = json.loads(Path(path).read_bytes())
     items = []
     for it in data:
         name = it.get('name')
@@ -43,14 +91,20 @@ def load_items(path):
         if total_frac > 0:
             comp = {k: float(v) / total_frac for k, v in comp.items()}
         items.append({'name': name, 'mass': mass, 'available': available, 'comp': comp})
-    return items
+    return tuple(items)
 
 
 def load_recipes(path):
     if not path or not os.path.exists(path):
         return {}
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    st = os.stat(path)
+    return dict(_load_recipes_cached(path, st.st_mtime_ns, st.st_size))
+
+
+@lru_cache(maxsize=8)
+def _load_recipes_cached(path, mtime_ns, size):
+    # read the whole file and parse it in one pass; cached like _load_items_cached
+    return json.loads(Path(path).read_bytes())
 
 
 def parse_recipe_string(s):
@@ -58,18 +112,661 @@ def parse_recipe_string(s):
     bounds = {}
     if not s:
         return bounds
-    parts = s.split(';')
-    for p in parts:
+    for p in s.split(';'):
         if not p.strip():
             continue
-        k, rng = p.split(':')
-        lo, hi = rng.split('-')
-        bounds[k.strip()] = (float(lo), float(hi))
+        m = _RECIPE_RE.fullmatch(p)
+        if not m:
+            raise ValueError(f"Malformed recipe entry {p.strip()!r}; expected Element:lo-hi")
+        k, lo, hi = m.groups()
+        bounds[k] = (float(lo), float(hi))
     return bounds
 
 
-def compute_percentages(mass_by_element, total_mass, elements):
-    return {el: (mass_by_element.get(el, 0.0) / total_mass) for el in elements}
+def items_to_soa(items, elements):
+    names = [it['name'] for it in items]
+    masses = np.array([it['mass'] for it in items], dtype=np.float64)
+    available = np.array([it['available'] for it in items], dtype=np.int64)
+    comp_mat = np.array([[it['comp'].get(el, 0.0) for el in elements] for it in items],
+                        dtype=np.float64).reshape(len(items), len(elements))
+    return Inventory(names, masses, available, comp_mat, [it['comp'] for it in items])
+
+
+def bounds_to_arrays(bounds, elements):
+    lo = np.array([bounds[el][0] for el in elements], dtype=np.float64)
+    hi = np.array([bounds[el][1] for el in elements], dtype=np.float64)
+    return lo, hi
+
+
+def integer_mass_scale(masses, max_decimals=6):
+    # Smallest power of ten that turns every mass into a whole number of units
+    for d in range(max_decimals + 1):
+        scaled = masses * 10 ** d
+        if np.all(np.abs(scaled - np.round(scaled)) < 1e-6):
+            return 10 ** d
+    warnings.warn(f"masses with more than {max_decimals} decimal places are rounded to 1e-{max_decimals} mb "
+                  "for the search", RuntimeWarning, stacklevel=2)
+    return 10 ** max_decimals
+
+
+def covering_combinations(item_mask, required_mask, r):
+    # r-combinations of item indices whose element bitmasks together cover required_mask, as rows
+    # of an array in itertools order. Built one column at a time, dropping every prefix that can
+    # no longer pick up the missing elements from the items after it.
+    n = len(item_mask)
+    # elements carried by the items from each position onwards
+    suffix_mask = np.zeros(n + 1, np.uint64)
+    if n:
+        suffix_mask[:n] = np.bitwise_or.accumulate(item_mask[::-1])[::-1]
+    combos = np.empty((1, 0), np.int64)
+    masks = np.zeros(1, np.uint64)
+    last = np.full(1, -1, np.int64)
+    for k in range(r):
+        # extend each prefix by every later index that leaves enough items for the remaining slots
+        starts = last + 1
+        widths = np.maximum(n - (r - k - 1) - starts, 0)
+        rows = np.repeat(np.arange(len(combos)), widths)
+        offsets = np.arange(rows.size) - np.repeat(np.cumsum(widths) - widths, widths)
+        last = starts[rows] + offsets
+        combos = np.column_stack([combos[rows], last])
+        masks = masks[rows] | item_mask[last]
+        reach = masks | suffix_mask[last + 1] if k < r - 1 else masks
+        keep = (reach & required_mask) == required_mask
+        combos, masks, last = combos[keep], masks[keep], last[keep]
+    return combos
+
+
+def compute_percentages(elem_mass, total_mass, elements):
+    return {el: (m / total_mass) for el, m in zip(elements, elem_mass.tolist())}
+
+
+@_kernel(cache=True)
+def _greedy_max_gain(pos, budget, col, bound, order, mass_sorted, avail_sorted):
+    # Upper bound on how far the remaining items can raise elem - bound * total within `budget`
+    # mass units: every unit of mass from item j moves it by col[j] - bound, so fill the budget
+    # with the best movers first (`order` sorts col best-first) and stop once none helps. Taking
+    # a fraction of the last item keeps this an upper bound.
+    remaining = budget
+    gain = 0
+    for j in order:
+        if j < pos:
+            continue
+        step = col[j] - bound
+        if step <= 0:
+            break
+        take_mass = min(avail_sorted[j] * mass_sorted[j], remaining)
+        gain += take_mass * step
+        remaining -= take_mass
+        if remaining <= 0:
+            break
+    return gain
+
+
+@_kernel(cache=True)
+def _reachable_totals(mass_sorted, avail_sorted, limit):
+    # Bounded-knapsack DP over integer masses: reach[i, t] is True when the items from position i
+    # onwards can add exactly t mass units (0 <= t <= limit). Returned as running counts along t
+    # so that "is any total in [a, b] reachable" is an O(1) lookup.
+    n = mass_sorted.shape[0]
+    reach = np.zeros((n + 1, limit + 1), np.bool_)
+    reach[n, 0] = True
+    used = np.empty(limit + 1, np.int64)
+    for i in range(n - 1, -1, -1):
+        m = mass_sorted[i]
+        avail = avail_sorted[i]
+        if m <= 0 or avail <= 0:
+            reach[i] = reach[i + 1]
+            continue
+        # used[t]: fewest units of item i needed to reach t on top of the later items
+        for t in range(limit + 1):
+            if reach[i + 1, t]:
+                reach[i, t] = True
+                used[t] = 0
+            elif t >= m and reach[i, t - m] and used[t - m] < avail:
+                reach[i, t] = True
+                used[t] = used[t - m] + 1
+    counts = np.empty((n + 1, limit + 1), np.int32)
+    for i in range(n + 1):
+        running = 0
+        for t in range(limit + 1):
+            if reach[i, t]:
+                running += 1
+            counts[i, t] = running
+    return counts
+
+
+@_kernel(cache=True)
+def _window_reachable(row_counts, curr_mass, MIN_TOTAL, MAX_TOTAL):
+    limit = row_counts.shape[0] - 1
+    a = max(MIN_TOTAL - curr_mass, 0)
+    b = min(MAX_TOTAL - curr_mass, limit)
+    if a > b:
+        return False
+    below = row_counts[a - 1] if a > 0 else 0
+    return row_counts[b] > below
+
+
+@_kernel(cache=True)
+def _element_shortfall(elem_mass, rem_elem, lo, min_total, check_order):
+    for e in check_order:
+        if elem_mass[e] + rem_elem[e] < lo[e] * min_total:
+            return True
+    return False
+
+
+@_kernel(cache=True)
+def _element_conflict_level(pos, counts, contrib_sorted, elem_mass, hi, MAX_TOTAL):
+    # Element masses only grow deeper in the tree, so an element already above its upper bound at
+    # the largest allowed total rules out the whole subtree. Returns the deepest level whose count
+    # added that element (-1 if none did), or pos when there is no such conflict.
+    if MAX_TOTAL <= 0:
+        return pos
+    # one bit per overflowing element, gathered without branching; almost every node has none
+    over = 0
+    for e in range(len(hi)):
+        over |= np.int64(elem_mass[e] > hi[e] * MAX_TOTAL) << e
+    if over == 0:
+        return pos
+    level = pos
+    for e in range(len(hi)):
+        if over >> e & 1:
+            culprit = -1
+            for j in range(pos - 1, -1, -1):
+                if counts[j] > 0 and contrib_sorted[e, j] > 0:
+                    culprit = j
+                    break
+            level = min(level, culprit)
+    return level
+
+
+@_kernel(cache=True)
+def _grow_rows(buf):
+    grown = np.empty((2 * buf.shape[0], buf.shape[1]), buf.dtype)
+    grown[:buf.shape[0]] = buf
+    return grown
+
+
+@_kernel(cache=True)
+def _grow_vec(buf):
+    grown = np.empty(2 * buf.shape[0], buf.dtype)
+    grown[:buf.shape[0]] = buf
+    return grown
+
+
+# Every integer division in the kernel is guarded by a positive-divisor check, so numpy's error
+# model lets numba drop its per-division ZeroDivisionError branches from the hot loop
+@_kernel(cache=True, error_model='numpy')
+def _search_combo(combo, masses, available, comp_mat, contrib, lo, hi, check_order, MIN_TOTAL, MAX_TOTAL,
+                  reach_limit, TARGET, over_weight, under_weight, score_cap):
+    # Iterative backtracking over integer counts for one combo of item indices (already sorted
+    # by mass desc). Counts are tried from the largest down to one at each position: leaving an
+    # item out is the smaller combo's job, so equivalent solutions aren't reported once per
+    # unused item. Every assignment that satisfies the mass window and composition bounds and
+    # scores no worse than score_cap (the current worst of the caller's top-K) is written as one
+    # row of the returned (counts, total_mass, elem_mass, score) arrays, in the order it was found.
+    #
+    # Everything is integer: masses, MIN_TOTAL, TARGET and MAX_TOTAL are in units of 1/mass_scale
+    # mb, compositions and lo/hi in units of 1/COMP_SCALE, so an element's share is within bounds
+    # exactly when lo * total <= elem_mass <= hi * total. A score is the distance to TARGET times
+    # the (integer) weight for its side, compared exactly against score_cap. Per-element tests
+    # visit the elements in check_order (narrowest bounds first) so they fail as early as possible.
+    n = combo.shape[0]
+    # lo/hi arrive as fixed-length tuples, so numba compiles one specialization per element
+    # count and every per-element loop below has a compile-time trip count it can unroll
+    n_el = len(lo)
+    mass_sorted = np.empty(n, np.int64)
+    avail_sorted = np.empty(n, np.int64)
+    comp_sorted = np.empty((n_el, n), np.int64)
+    contrib_sorted = np.empty((n_el, n), np.int64)
+    for i in range(n):
+        mass_sorted[i] = masses[combo[i]]
+        avail_sorted[i] = available[combo[i]]
+        for e in range(n_el):
+            comp_sorted[e, i] = comp_mat[combo[i], e]
+            contrib_sorted[e, i] = contrib[combo[i], e]
+
+    # Remaining mass, remaining mass of each element, and the mass of one unit of each item
+    # (the least the remaining items must add) from each position onwards
+    rem_mass_from = np.zeros(n + 1, np.int64)
+    rem_elem_from = np.zeros((n + 1, n_el), np.int64)
+    min_mass_from = np.zeros(n + 1, np.int64)
+    for i in range(n - 1, -1, -1):
+        rem_mass_from[i] = rem_mass_from[i + 1] + mass_sorted[i] * avail_sorted[i]
+        min_mass_from[i] = min_mass_from[i + 1] + mass_sorted[i]
+        for e in range(n_el):
+            rem_elem_from[i, e] = rem_elem_from[i + 1, e] + contrib_sorted[e, i] * avail_sorted[i]
+
+    # Exact reachable-total table (reach_limit < 0 disables it)
+    use_reach = reach_limit >= 0
+    reach_counts = _reachable_totals(mass_sorted, avail_sorted, max(reach_limit, 0))
+
+    # A leaf scoring within score_cap has its total in a window around the target; the mass
+    # bounds below search that window rather than the whole allowance. A side whose weight isn't
+    # positive doesn't grow the score with distance, so it keeps the allowance's bound.
+    lo_total = MIN_TOTAL
+    hi_total = MAX_TOTAL
+    if under_weight > 0:
+        lo_total = max(MIN_TOTAL, TARGET - score_cap // under_weight)
+    if over_weight > 0:
+        hi_total = min(MAX_TOTAL, TARGET + score_cap // over_weight)
+
+    # Per-element visiting orders for the greedy bounds: richest first for raising an element's
+    # share, and (on the negated compositions) leanest first for diluting it
+    neg_comp_sorted = -comp_sorted
+    order_desc = np.empty((n_el, n), np.int64)
+    order_asc = np.empty((n_el, n), np.int64)
+    for e in range(n_el):
+        order_desc[e] = np.argsort(neg_comp_sorted[e], kind='mergesort')
+        order_asc[e] = np.argsort(comp_sorted[e], kind='mergesort')
+
+    # Result buffers, doubled whenever they fill up
+    n_out = 0
+    counts_buf = np.empty((16, n), np.int32)
+    totals_buf = np.empty(16, np.int64)
+    elem_buf = np.empty((16, n_el), np.int64)
+    score_buf = np.empty(16, np.int64)
+    counts = np.zeros(n, np.int32)
+    min_counts = np.zeros(n, np.int32)
+    mass_stack = np.zeros(n + 1, np.int64)
+    elem_mass = np.zeros(n_el, np.int64)
+
+    pos = 0
+    descend = True
+    # Conflict-directed back-jumping: when an element is already over its cap, only a level that
+    # contributed it can repair that, so unwinding skips the remaining counts of every deeper level
+    jump_to = n
+    while True:
+        if descend:
+            curr_mass = mass_stack[pos]
+            conflict = _element_conflict_level(pos, counts, contrib_sorted, elem_mass, hi, MAX_TOTAL)
+            if conflict < pos:
+                jump_to = conflict
+                descend = False
+                continue
+            if pos == n:
+                # Leaf: with nothing left to add, the greedy bounds below collapse to the exact
+                # fractions, so the mass window and composition tests are settled in one pass
+                if curr_mass >= TARGET:
+                    score = (curr_mass - TARGET) * over_weight
+                else:
+                    score = (TARGET - curr_mass) * under_weight
+                if MIN_TOTAL <= curr_mass <= MAX_TOTAL and curr_mass > 0 and score <= score_cap:
+                    ok = True
+                    for e in check_order:
+                        if elem_mass[e] < lo[e] * curr_mass or elem_mass[e] > hi[e] * curr_mass:
+                            ok = False
+                            break
+                    if ok:
+                        if n_out == score_buf.shape[0]:
+                            counts_buf = _grow_rows(counts_buf)
+                            totals_buf = _grow_vec(totals_buf)
+                            elem_buf = _grow_rows(elem_buf)
+                            score_buf = _grow_vec(score_buf)
+                        counts_buf[n_out] = counts
+                        totals_buf[n_out] = curr_mass
+                        elem_buf[n_out] = elem_mass
+                        score_buf[n_out] = score
+                        n_out += 1
+                descend = False
+                continue
+
+            feasible = True
+            # prune large overshoot; mass only grows further down, so past the score window the
+            # score can only get worse
+            if curr_mass + min_mass_from[pos] > hi_total:
+                feasible = False
+            # Prune if even using all remaining items we can't reach the minimum total mass
+            elif curr_mass + rem_mass_from[pos] < lo_total:
+                feasible = False
+            # Prune if no combination of the remaining counts lands the total inside the window
+            elif use_reach and not _window_reachable(reach_counts[pos], curr_mass, lo_total, hi_total):
+                feasible = False
+            # Prune if taking every remaining unit still leaves an element short of its lower bound
+            # at the smallest total a solution can have
+            elif _element_shortfall(elem_mass, rem_elem_from[pos], lo, max(curr_mass, lo_total), check_order):
+                feasible = False
+            else:
+                # Prune when some element can't be brought inside its bounds: fill the mass still
+                # allowed (up to hi_total) with the items that raise its share most for the lower
+                # bound, and with the ones that dilute it most for the upper bound
+                mass_budget_total = min(hi_total, curr_mass + rem_mass_from[pos]) - curr_mass
+                for e in check_order:
+                    curr_elem = elem_mass[e]
+                    too_little = curr_elem - lo[e] * curr_mass + _greedy_max_gain(
+                        pos, mass_budget_total, comp_sorted[e], lo[e], order_desc[e], mass_sorted, avail_sorted) < 0
+                    too_much = hi[e] * curr_mass - curr_elem + _greedy_max_gain(
+                        pos, mass_budget_total, neg_comp_sorted[e], -hi[e], order_asc[e], mass_sorted, avail_sorted) < 0
+                    if too_little or too_much:
+                        feasible = False
+                        break
+
+            if feasible:
+                mass_per_item = mass_sorted[pos]
+                avail = avail_sorted[pos]
+                # max count by mass remaining after a unit of each later item, min count by what
+                # the later items can still add
+                if mass_per_item > 0:
+                    max_count = min(avail, (hi_total - curr_mass - min_mass_from[pos + 1]) // mass_per_item)
+                    shortfall = lo_total - curr_mass - rem_mass_from[pos + 1]
+                    min_count = max(1, -(-shortfall // mass_per_item))
+                else:
+                    max_count = avail
+                    min_count = 1
+                # ... and by each element's lower bound: whatever the later items can't supply of
+                # it has to come from this one
+                floor_total = max(curr_mass, lo_total)
+                for e in check_order:
+                    unit_elem = contrib_sorted[e, pos]
+                    if unit_elem > 0:
+                        need = lo[e] * floor_total - elem_mass[e] - rem_elem_from[pos + 1, e]
+                        if need > 0:
+                            min_count = max(min_count, -(-need // unit_elem))
+                if min_count > max_count:
+                    descend = False
+                    continue
+                min_counts[pos] = min_count
+                # try larger counts first to encourage overshoot combination
+                cnt = max_count
+            else:
+                descend = False
+                continue
+        else:
+            # unwind one level and move on to the next smaller count there
+            if pos == 0:
+                break
+            pos -= 1
+            cnt = counts[pos]
+            if pos > jump_to or cnt <= min_counts[pos]:
+                # leaving this level: take its whole contribution back out
+                if pos <= jump_to:
+                    jump_to = n
+                if cnt > 0:
+                    for e in range(n_el):
+                        elem_mass[e] -= cnt * contrib_sorted[e, pos]
+                continue
+            jump_to = n
+            # the next sibling differs by one unit, so undo just that unit
+            counts[pos] = cnt - 1
+            for e in range(n_el):
+                elem_mass[e] -= contrib_sorted[e, pos]
+            mass_stack[pos + 1] -= mass_sorted[pos]
+            pos += 1
+            descend = True
+            continue
+
+        counts[pos] = cnt
+        if cnt > 0:
+            for e in range(n_el):
+                elem_mass[e] += cnt * contrib_sorted[e, pos]
+        mass_stack[pos + 1] = mass_stack[pos] + cnt * mass_sorted[pos]
+        pos += 1
+
+    return counts_buf[:n_out], totals_buf[:n_out], elem_buf[:n_out], score_buf[:n_out]
+
+
+def _use_compiled_kernels():
+    # Swap every kernel for its numba-compiled version, once per process; the kernels call each
+    # other through the module globals, so each one compiles against the compiled others.
+    # Returns whether the compiled kernels are in use (False when numba isn't installed).
+    if hasattr(_search_combo, 'py_func'):
+        return True
+    try:
+        from numba import njit
+    except ImportError:
+        return False
+    kernels = globals()
+    for name, options in _kernel_options.items():
+        kernels[name] = njit(**options)(kernels[name])
+    return True
+
+
+# Search inputs shared by every combo, installed once per process by _init_search
+_search_state = {}
+
+
+def _init_search(state):
+    _search_state.clear()
+    _search_state.update(state)
+    if state['jit']:
+        # a worker started without the parent's globals compiles (or loads) its own
+        _use_compiled_kernels()
+
+
+def _split_count(members, available, count):
+    # Spread `count` units of a grouped item over its member items, most plentiful first; returns
+    # (item index, count) pairs for the members that are used
+    split = []
+    for i in members:
+        take = min(count, available[i])
+        if take > 0:
+            split.append((i, take))
+            count -= take
+    return split
+
+
+def _search_chunk(task):
+    # Search one (start, step, combos) task, where combos[k] is combo start + k * step of the full
+    # enumeration, keeping only the best `top` candidates in a bounded max-heap whose worst score
+    # bounds the kernel across the whole task. Returns (sort key, solution) pairs; the key ends
+    # with the enumeration position so ties resolve exactly as a stable sort over every candidate
+    # would.
+    start, step, chunk = task
+    st = _search_state
+    mass_scale = st['mass_scale']
+    # element masses come back in units of 1 / (mass_scale * COMP_SCALE) mb, scores in units of
+    # 1 / (mass_scale * WEIGHT_SCALE)
+    elem_scale = mass_scale * COMP_SCALE
+    score_scale = mass_scale * WEIGHT_SCALE
+    recheck = st['recheck']
+    lo_frac, hi_frac = st['lo_frac'], st['hi_frac']
+    unit_elem = st['unit_elem']
+    available = st['available']
+    members = st['members']
+    member_available = st['member_available']
+    scarcity_tables = st['scarcity_tables']
+    target = st['target']
+    target_units = st['target_units']
+    over_weight, under_weight = st['weights']
+    top = st['top']
+
+    # entries are (-score, -scarcity, -combo position, -row, solution): heap[0] is the current worst
+    heap = []
+    for k, combo_sorted in enumerate(chunk):
+        pos = start + k * step
+        score_cap = -heap[0][0] if len(heap) >= top else st['score_limit']
+        combo_arr = np.array(combo_sorted, dtype=np.int64)
+        counts_buf, totals_buf, elem_buf, score_buf = _search_combo(
+            combo_arr, st['mass_units'], available, st['comp_units'], st['contrib'], st['lo'], st['hi'],
+            st['check_order'], st['min_total'], st['max_total'], st['reach_limit'], target_units,
+            over_weight, under_weight, score_cap)
+        if recheck:
+            # The kernel only saw rounded compositions against widened bounds: test each
+            # candidate's real shares the way the float search did, and report its real
+            # element masses
+            elem_rows = counts_buf @ unit_elem[combo_arr]
+            shares = elem_rows / (totals_buf / mass_scale)[:, None]
+            ok = np.all((shares >= lo_frac - 1e-9) & (shares <= hi_frac + 1e-9), axis=1)
+            counts_buf, totals_buf, elem_rows, score_buf = counts_buf[ok], totals_buf[ok], elem_rows[ok], score_buf[ok]
+        else:
+            elem_rows = elem_buf / elem_scale
+        # scarcity score: sum(cnt/available) over the items each count is split onto, for every
+        # row at once; columns are added in combo order so each row's float sum matches the
+        # scalar loop exactly
+        scarcity_buf = np.zeros(score_buf.shape[0])
+        for j, g in enumerate(combo_sorted):
+            scarcity_buf += scarcity_tables[g][counts_buf[:, j]]
+        counts_rows = counts_buf.tolist()
+        for row, (score, scarcity) in enumerate(zip(score_buf.tolist(), scarcity_buf.tolist())):
+            if len(heap) >= top and (score, scarcity) >= (-heap[0][0], -heap[0][1]):
+                continue
+            combo, counts = [], []
+            for g, cnt in zip(combo_sorted, counts_rows[row]):
+                for i, take in _split_count(members[g], member_available, cnt):
+                    combo.append(i)
+                    counts.append(take)
+            total_mass = totals_buf[row] / mass_scale
+            solution = {
+                'combo': combo,
+                'counts': counts,
+                'total_mass': total_mass,
+                'elem_mass': elem_rows[row],
+                'diff': abs(total_mass - target),
+                'scarcity': scarcity,
+                'score': score / score_scale,
+            }
+            entry = (-score, -scarcity, -pos, -row, solution)
+            if len(heap) < top:
+                heapq.heappush(heap, entry)
+            else:
+                heapq.heapreplace(heap, entry)
+    return [((-e[0], -e[1], -e[2], -e[3]), e[4]) for e in heap]
+
+
+def find_solutions(inventory, elements, bounds, target_mb, allowance_mb, max_types, top, prefer_overshoot=True,
+                   workers=1):
+    # Best `top` solutions for the inventory, ordered by (score, scarcity) with ties in
+    # enumeration order; empty when nothing fits the mass window and composition bounds
+    if top < 1:
+        raise ValueError('top must be at least 1')
+    min_total = target_mb - allowance_mb
+    max_total = target_mb + allowance_mb
+    lo_arr, hi_arr = bounds_to_arrays(bounds, elements)
+
+    # Items with the same mass and recipe composition are interchangeable, so they are searched
+    # as one item holding their combined stock rather than once per way of spreading a count
+    # over them. Each count is split back onto the items afterwards, most plentiful first, which
+    # is also the split with the lowest scarcity.
+    groups = {}
+    for i, key in enumerate(zip(inventory.masses.tolist(), map(tuple, inventory.comp_mat.tolist()))):
+        groups.setdefault(key, []).append(i)
+    member_available = inventory.available.tolist()
+    members = [sorted(group, key=lambda i: -member_available[i]) for group in groups.values()]
+    first = [group[0] for group in groups.values()]
+    masses, comp_mat = inventory.masses[first], inventory.comp_mat[first]
+    available = np.array([sum(member_available[i] for i in group) for group in members], dtype=np.int64)
+    # scarcity of every possible count of a grouped item, as split by _split_count
+    scarcity_tables = []
+    for group, total in zip(members, available.tolist()):
+        table = np.zeros(total + 1)
+        taken = 0
+        for i in group:
+            avail = member_available[i]
+            if avail > 0:
+                table += np.clip(np.arange(total + 1) - taken, 0, avail) / avail
+                taken += avail
+        scarcity_tables.append(table)
+
+    # The kernel works on integers only: masses in units of 1/mass_scale mb (1 for whole-mb
+    # inventories) and compositions/bounds in units of 1/COMP_SCALE
+    mass_scale = integer_mass_scale(np.append(masses, target_mb))
+    mass_units = np.round(masses * mass_scale).astype(np.int64)
+    comp_units = np.round(comp_mat * COMP_SCALE).astype(np.int64)
+    # Compositions and bounds on that grid are exact. Off it (e.g. a 2:1 composition normalised
+    # to 0.666...) a rounded composition is off by up to half a unit, and so is any mix's share,
+    # so the kernel gets bounds widened by that much (and by the float search's 1e-9 tolerance)
+    # and every candidate it finds is checked against the real fractions afterwards
+    on_grid = all(np.all(np.abs(x * COMP_SCALE - np.round(x * COMP_SCALE)) < 1e-6)
+                  for x in (comp_mat, lo_arr, hi_arr))
+    if on_grid:
+        lo_units = np.round(lo_arr * COMP_SCALE).astype(np.int64)
+        hi_units = np.round(hi_arr * COMP_SCALE).astype(np.int64)
+    else:
+        lo_units = np.maximum(np.floor((lo_arr - 1e-9) * COMP_SCALE - 0.5), 0).astype(np.int64)
+        hi_units = np.ceil((hi_arr + 1e-9) * COMP_SCALE + 0.5).astype(np.int64)
+    min_units = math.ceil(min_total * mass_scale - 1e-9)
+    max_units = math.floor(max_total * mass_scale + 1e-9)
+    target_units = round(target_mb * mass_scale)
+    # element mass contributed by one unit of each item
+    contrib = comp_units * mass_units[:, None]
+
+    # One bit per recipe element: which elements each item carries, and which ones the recipe
+    # needs a non-zero share of. A combo lacking any required element can't qualify.
+    element_bits = np.left_shift(np.uint64(1), np.arange(len(elements), dtype=np.uint64))
+    item_mask = np.bitwise_or.reduce(np.where(comp_mat > 0.0, element_bits, np.uint64(0)), axis=1)
+    required_mask = np.bitwise_or.reduce(element_bits[lo_arr > 1e-9])
+
+    # Loop invariants for scoring candidates: heavily prefer overshoot if enabled. Weights are
+    # (over, under) in units of 1/WEIGHT_SCALE, i.e. (0.5, 2.0) and (1.0, 1.0)
+    weights = (1, 4) if prefer_overshoot else (2, 2)
+    # no candidate inside the mass window can score worse than this
+    score_limit = max(max_units - target_units, target_units - min_units, 0) * max(weights)
+
+    # The kernel's reachable-total table needs a bounded window
+    if 0 <= max_units <= REACH_LIMIT_UNITS:
+        reach_limit = max_units
+    else:
+        reach_limit = -1
+
+    # Combinations of up to max types that cover every required element; the kernel wants each
+    # ordered by mass desc for pruning, so reorder any rows the inventory order leaves unsorted
+    all_combos = []
+    for r in range(1, max_types + 1):
+        combos = covering_combinations(item_mask, required_mask, r)
+        if np.any(np.diff(masses[combos], axis=1) > 0):
+            order = np.argsort(-masses[combos], axis=1, kind='stable')
+            combos = np.take_along_axis(combos, order, axis=1)
+        all_combos.extend(combos.tolist())
+
+    # The narrowest bounds are the likeliest to fail, so the kernel tests them first. Bounds go
+    # to the kernel as tuples so it is specialised per element count; an empty tuple can't be
+    # indexed by numba, so a recipe without elements keeps the arrays
+    check_order = np.argsort(hi_units - lo_units, kind='stable')
+    if len(elements):
+        bounds_lo, bounds_hi = tuple(lo_units.tolist()), tuple(hi_units.tolist())
+        check_order = tuple(check_order.tolist())
+    else:
+        bounds_lo, bounds_hi = lo_units, hi_units
+
+    # Compiling only pays off once the search is big enough to outweigh numba's start-up cost
+    jit = len(all_combos) >= JIT_MIN_COMBOS and _use_compiled_kernels()
+
+    state = {
+        'jit': jit, 'mass_units': mass_units, 'mass_scale': mass_scale, 'available': available,
+        'comp_units': comp_units, 'contrib': contrib, 'lo': bounds_lo, 'hi': bounds_hi,
+        'check_order': check_order, 'min_total': min_units, 'max_total': max_units, 'reach_limit': reach_limit,
+        'members': members, 'member_available': member_available, 'scarcity_tables': scarcity_tables,
+        'target': target_mb, 'recheck': not on_grid, 'lo_frac': lo_arr, 'hi_frac': hi_arr,
+        'unit_elem': masses[:, None] * comp_mat,
+        'target_units': target_units, 'weights': weights, 'score_limit': score_limit, 'top': top,
+    }
+    # One interleaved share of the combos per worker, so every worker sees a similar mix of
+    # combo sizes and its top-K bound tightens over its whole share
+    workers = max(1, min(workers, len(all_combos)))
+    tasks = [(w, workers, all_combos[w::workers]) for w in range(workers)]
+
+    # DFS search over the combos; every task returns its own top candidates, merged below
+    candidates = []
+    if workers > 1:
+        with Pool(workers, initializer=_init_search, initargs=(state,)) as pool:
+            for found in pool.imap_unordered(_search_chunk, tasks):
+                candidates.extend(found)
+    else:
+        _init_search(state)
+        try:
+            for found in map(_search_chunk, tasks):
+                candidates.extend(found)
+        finally:
+            # don't keep the search inputs alive between calls
+            _search_state.clear()
+
+    # top by (score, scarcity), ties in enumeration order
+    return [sol for _, sol in heapq.nsmallest(top, candidates, key=lambda c: c[0])]
+
+
+def precompile_kernels(max_elements=6):
+    # Run the search kernel once on a tiny problem per recipe size so numba compiles and caches
+    # every specialisation up front; the argument types match what find_solutions passes.
+    # Returns False when numba isn't installed.
+    if not _use_compiled_kernels():
+        return False
+    for n_el in range(1, max_elements + 1):
+        comp_units = np.full((1, n_el), COMP_SCALE // n_el, dtype=np.int64)
+        mass_units = np.ones(1, dtype=np.int64)
+        bounds = tuple([0] * n_el)
+        _search_combo(np.zeros(1, dtype=np.int64), mass_units, np.ones(1, dtype=np.int64), comp_units,
+                      comp_units * mass_units[:, None], bounds, tuple([COMP_SCALE] * n_el), tuple(range(n_el)),
+                      0, 1, 1, 1, 1, 1, 1)
+    return True
 
 
 def main():
@@ -80,6 +777,7 @@ def main():
     parser.add_argument('--allowance', type=float, default=144.0, help='Allowed +/- mass tolerance (default: 144)')
     parser.add_argument('--max-types', type=int, default=4, help='Max distinct item types to use (default: 4)')
     parser.add_argument('--top', type=int, default=1, help='How many top solutions to print (default: 1)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for the combination search (default: 1)')
     # prefer_overshoot default True; provide --no-prefer-overshoot to disable
     parser.add_argument('--prefer-overshoot', dest='prefer_overshoot', action='store_true', help='Prefer overshooting the target (default: enabled)')
     parser.add_argument('--no-prefer-overshoot', dest='prefer_overshoot', action='store_false', help='Do not prefer overshoot')
@@ -87,7 +785,15 @@ def main():
     parser.add_argument('--add-item', action='append', help="Add single-element item: 'Name,mass,available,Element' (can be repeated)")
     parser.add_argument('--recipe', help="Inline recipe bounds: Cu:0.50-0.65;Zn:0.20-0.30;Bi:0.10-0.20")
     parser.add_argument('--target-recipe', help='Name of recipe in recipes file to use')
+    parser.add_argument('--precompile', action='store_true',
+                        help='Compile and cache the search kernel for recipes of up to 6 elements, then exit')
     args = parser.parse_args()
+    if args.precompile:
+        if not precompile_kernels():
+            print("numba is not installed; the search runs as plain Python and needs no precompiling.")
+        return
+    if args.top < 1:
+        parser.error('--top must be at least 1')
 
     items = load_items(args.items_file)
     recipes = load_recipes(args.recipes_file)
@@ -107,8 +813,6 @@ def main():
 
     TARGET_MB = args.target
     ALLOWANCE_MB = args.allowance
-    MIN_TOTAL = TARGET_MB - ALLOWANCE_MB
-    MAX_TOTAL = TARGET_MB + ALLOWANCE_MB
 
     # Choose composition bounds
     if args.target_recipe:
@@ -118,7 +822,10 @@ def main():
             print(f"Recipe '{args.target_recipe}' not found in {args.recipes_file}. Exiting.")
             return
     elif args.recipe:
-        COMPOSITION_BOUNDS = parse_recipe_string(args.recipe)
+        try:
+            COMPOSITION_BOUNDS = parse_recipe_string(args.recipe)
+        except ValueError as e:
+            parser.error(str(e))
     else:
         # default bismuth bronze
         COMPOSITION_BOUNDS = {'Cu': (0.50, 0.65), 'Zn': (0.20, 0.30), 'Bi': (0.10, 0.20)}
@@ -130,199 +837,29 @@ def main():
     if not filtered_items:
         # If no items match the recipe elements, fall back to full list
         filtered_items = items
-    ITEMS = filtered_items
-    item_index = list(range(len(ITEMS)))
-
-    best_solutions = []
-
-    # DFS search over combinations of up to max types
-    for r in range(1, args.max_types + 1):
-        for combo in combinations(item_index, r):
-            # order by mass desc for pruning
-            combo_sorted = sorted(combo, key=lambda i: -ITEMS[i]['mass'])
-
-            # Precompute remaining mass and list of remaining items from each position
-            n = len(combo_sorted)
-            rem_mass_from = [0.0] * (n + 1)
-            rem_list_from = [None] * (n + 1)
-            rem_list_from[n] = []
-            for i in range(n - 1, -1, -1):
-                idx_i = combo_sorted[i]
-                it = ITEMS[idx_i]
-                m_total = it['mass'] * it['available']
-                rem_mass_from[i] = rem_mass_from[i + 1] + m_total
-                # build list of remaining item descriptors for greedy bounds
-                lst = rem_list_from[i + 1].copy()
-                lst.insert(0, {
-                    'idx': idx_i,
-                    'mass': it['mass'],
-                    'available': it['available'],
-                    'comp': it.get('comp', {})
-                })
-                rem_list_from[i] = lst
-
-            def dfs(pos, curr_counts, curr_mass, mass_by_element):
-                # prune large overshoot
-                if curr_mass > MAX_TOTAL:
-                    return
-
-                # Prune if even using all remaining items we can't reach the minimum total mass
-                if curr_mass + rem_mass_from[pos] < MIN_TOTAL:
-                    return
-
-                # Prune by checking optimistic per-element achievable fractions using a greedy fill
-                # We'll attempt to fill the remaining mass (up to MAX_TOTAL) with the highest-density
-                # contributors for each element to get a tight upper bound, and similarly fill with
-                # zero-density contributors for a lower bound.
-                max_possible_total = min(MAX_TOTAL, curr_mass + rem_mass_from[pos])
-                if max_possible_total <= 0.0:
-                    return
-
-                mass_budget_total = max_possible_total - curr_mass
-
-                def greedy_max_add(el, budget):
-                    # greedily allocate budget to items with highest fraction for el
-                    remaining = budget
-                    added_elem = 0.0
-                    used_mass = 0.0
-                    # sort remaining items by density for el
-                    items_list = rem_list_from[pos]
-                    sorted_items = sorted(items_list, key=lambda x: x['comp'].get(el, 0.0), reverse=True)
-                    for it in sorted_items:
-                        frac = it['comp'].get(el, 0.0)
-                        if frac <= 0.0:
-                            continue
-                        mass_per = it['mass']
-                        max_units = it['available']
-                        # how many units can we take within remaining mass
-                        take = min(max_units, int(remaining // mass_per))
-                        if take <= 0:
-                            continue
-                        take_mass = take * mass_per
-                        added_elem += take_mass * frac
-                        used_mass += take_mass
-                        remaining -= take_mass
-                        if remaining < 1e-9:
-                            break
-                    return added_elem, used_mass
-
-                def greedy_min_possible_fraction(el, budget):
-                    # allocate as much of budget as possible to items with zero (or minimal) fraction
-                    remaining = budget
-                    used_mass = 0.0
-                    items_list = rem_list_from[pos]
-                    sorted_items = sorted(items_list, key=lambda x: x['comp'].get(el, 0.0))
-                    for it in sorted_items:
-                        frac = it['comp'].get(el, 0.0)
-                        if frac > 0.0:
-                            continue
-                        mass_per = it['mass']
-                        max_units = it['available']
-                        take = min(max_units, int(remaining // mass_per))
-                        if take <= 0:
-                            continue
-                        take_mass = take * mass_per
-                        used_mass += take_mass
-                        remaining -= take_mass
-                        if remaining < 1e-9:
-                            break
-                    denom = curr_mass + used_mass
-                    if denom <= 0.0:
-                        return 0.0
-                    return mass_by_element.get(el, 0.0) / denom
-
-                for el, (lo, hi) in COMPOSITION_BOUNDS.items():
-                    curr_elem = mass_by_element.get(el, 0.0)
-                    # optimistic add for el
-                    added_elem, used_mass = greedy_max_add(el, mass_budget_total)
-                    max_fraction = (curr_elem + added_elem) / (curr_mass + used_mass) if (curr_mass + used_mass) > 0 else 0.0
-                    # pessimistic min fraction by filling mass with zero-el items
-                    min_fraction = greedy_min_possible_fraction(el, mass_budget_total)
-                    if max_fraction + 1e-12 < lo or min_fraction - 1e-12 > hi:
-                        return
-                if pos == len(combo_sorted):
-                    if curr_mass < MIN_TOTAL or curr_mass > MAX_TOTAL:
-                        return
-                    # avoid division by zero for empty selections
-                    if curr_mass <= 0.0:
-                        return
-                    perc = compute_percentages(mass_by_element, curr_mass, elements)
-                    ok = True
-                    for el, (lo, hi) in COMPOSITION_BOUNDS.items():
-                        v = perc.get(el, 0.0)
-                        if v < lo - 1e-9 or v > hi + 1e-9:
-                            ok = False
-                            break
-                    if not ok:
-                        return
-                    # scarcity score: sum(cnt/available)
-                    scarcity = 0.0
-                    for idx, cnt in zip(combo_sorted, curr_counts):
-                        available = ITEMS[idx]['available']
-                        scarcity += (cnt / available) if available > 0 else float('inf')
-                    diff = abs(curr_mass - TARGET_MB)
-                    # heavily prefer overshoot if enabled
-                    if args.prefer_overshoot:
-                        if curr_mass >= TARGET_MB:
-                            score = diff * 0.5
-                        else:
-                            score = diff * 2.0
-                    else:
-                        score = diff
-                    best_solutions.append({
-                        'combo': combo_sorted.copy(),
-                        'counts': curr_counts.copy(),
-                        'total_mass': curr_mass,
-                        'percentages': perc,
-                        'diff': diff,
-                        'scarcity': scarcity,
-                        'score': score,
-                    })
-                    return
-
-                idx = combo_sorted[pos]
-                item = ITEMS[idx]
-                mass_per_item = item['mass']
-                available = item['available']
-                # max count by mass remaining
-                max_possible_by_mass = int((MAX_TOTAL - curr_mass) // mass_per_item) if mass_per_item > 0 else available
-                max_count = min(available, max_possible_by_mass)
-
-                # iterate counts (try larger first to encourage overshoot combination)
-                for cnt in range(max_count, -1, -1):
-                    new_mass = curr_mass + cnt * mass_per_item
-                    # update mass_by_element with composition fractions
-                    if cnt > 0 and item['comp']:
-                        for el, frac in item['comp'].items():
-                            mass_by_element[el] = mass_by_element.get(el, 0.0) + cnt * mass_per_item * frac
-                    curr_counts.append(cnt)
-                    dfs(pos + 1, curr_counts, new_mass, mass_by_element)
-                    curr_counts.pop()
-                    if cnt > 0 and item['comp']:
-                        for el, frac in item['comp'].items():
-                            mass_by_element[el] -= cnt * mass_per_item * frac
-
-            dfs(0, [], 0.0, {})
-
-    # sort by (score, scarcity)
-    best_solutions_sorted = sorted(best_solutions, key=lambda s: (s['score'], s['scarcity']))
-
-    if not best_solutions_sorted:
+    # Items that are out of stock can only ever be used zero times; searching them just repeats
+    # the smaller combos with an infinite scarcity. The rest are ordered by mass desc (stable, so
+    # equal masses keep their file order), which makes every generated combo heaviest-first.
+    in_stock = [it for it in filtered_items if it['available'] > 0]
+    inventory = items_to_soa(sorted(in_stock, key=lambda it: -it['mass']), elements)
+    masses, available = inventory.masses, inventory.available
+
+    top_solutions = find_solutions(inventory, elements, COMPOSITION_BOUNDS, TARGET_MB, ALLOWANCE_MB,
+                                   args.max_types, args.top, args.prefer_overshoot, args.workers)
+    if not top_solutions:
         print(f"No solutions found within +/-{ALLOWANCE_MB} mb that satisfy composition bounds.")
         return
 
-    print(f"Found {len(best_solutions_sorted)} candidate(s). Showing top {min(args.top, len(best_solutions_sorted))}:\n")
-    for i, sol in enumerate(best_solutions_sorted[:args.top], 1):
+    print(f"Showing top {len(top_solutions)} candidate(s):\n")
+    for i, sol in enumerate(top_solutions, 1):
         print(f"Solution #{i}: total_mass = {sol['total_mass']:.1f} mb (diff {sol['diff']:.1f})  score={sol['score']:.3f}")
         print(f"  scarcity score: {sol['scarcity']:.4f}")
         print("  Breakdown:")
         for idx, cnt in zip(sol['combo'], sol['counts']):
-            if cnt == 0:
-                continue
-            item = ITEMS[idx]
-            comp_str = ", ".join([f"{k}:{v:.2f}" for k, v in item['comp'].items()]) if item['comp'] else '[]'
-            print(f"    - {item['name']}: {cnt} x {item['mass']} mb = {cnt*item['mass']} mb  (comp: {comp_str}; available {item['available']})")
-        perc = sol['percentages']
+            comp = inventory.comps[idx]
+            comp_str = ", ".join([f"{k}:{v:.2f}" for k, v in comp.items()]) if comp else '[]'
+            print(f"    - {inventory.names[idx]}: {cnt} x {masses[idx]} mb = {cnt*masses[idx]} mb  (comp: {comp_str}; available {available[idx]})")
+        perc = compute_percentages(sol['elem_mass'], sol['total_mass'], elements)
         perc_str = ", ".join([f"{el}: {perc.get(el,0.0)*100:.2f}%" for el in elements])
         print(f"  Percentages: {perc_str}\n")
 
@@ -0,0 +1,253 @@
+import itertools
+import json
+import os
+import sys
+from fractions import Fraction
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import alloy_calc  # noqa: E402
+
+
+def _item(name, mass, available, comp):
+    return {'name': name, 'mass': mass, 'available': available, 'comp': comp}
+
+
+# Small inventories; every mass, composition and bound is a short decimal or a simple fraction,
+# so the brute force below can check every constraint with exact fractions
+BRONZE_ITEMS = [
+    _item('Copper Nugget', 16, 6, {'Cu': 1.0}),
+    _item('Copper Ore', 24, 4, {'Cu': 1.0}),
+    _item('Tin Nugget', 16, 3, {'Sn': 1.0}),
+    _item('Cassiterite', 36, 2, {'Sn': 1.0}),
+    _item('Bronze Scrap', 20, 3, {'Cu': 0.75, 'Sn': 0.25}),
+    _item('Empty Ore', 10, 0, {'Cu': 1.0}),
+    # interchangeable with Copper Nugget
+    _item('Native Copper', 16, 2, {'Cu': 1.0}),
+]
+BRONZE = {'Cu': (0.7, 0.8), 'Sn': (0.2, 0.3)}
+
+BRASS_ITEMS = [
+    _item('Copper Ingot', 100, 2, {'Cu': 1.0}),
+    _item('Malachite', 35, 4, {'Cu': 0.8, 'Zn': 0.2}),
+    _item('Sphalerite', 25, 5, {'Zn': 1.0}),
+    _item('Bismuthinite', 15, 3, {'Bi': 1.0}),
+    _item('Brass Shavings', 15, 4, {'Cu': 0.65, 'Zn': 0.35}),
+    # interchangeable with Sphalerite
+    _item('Zinc Dust', 25, 3, {'Zn': 1.0}),
+]
+BRASS = {'Cu': (0.6, 0.9), 'Zn': (0.1, 0.4), 'Bi': (0.0, 0.1)}
+
+# fractional masses and compositions off the 1/COMP_SCALE grid, as load_items produces for a
+# composition of {"Cu": 2, "Zn": 1}
+ODD_ITEMS = [
+    _item('Brass Bit', 30, 4, {'Cu': 2 / 3, 'Zn': 1 / 3}),
+    _item('Gilding Scrap', 14.4, 5, {'Cu': 0.123445, 'Zn': 0.876555}),
+    _item('Copper Shot', 7.25, 6, {'Cu': 1.0}),
+    _item('Zinc Shot', 12.5, 3, {'Zn': 1.0}),
+]
+ODD = {'Cu': (0.66667, 0.8), 'Zn': (0.12345, 0.4)}
+
+
+def _prepare(items, bounds):
+    # same inventory as main() builds: in-stock items, heaviest first
+    elements = list(bounds.keys())
+    in_stock = [it for it in items if it['available'] > 0]
+    return alloy_calc.items_to_soa(sorted(in_stock, key=lambda it: -it['mass']), elements), elements
+
+
+def _kind(inventory, i):
+    # items with the same mass and composition are one kind of item to the search
+    return inventory.masses[i], tuple(sorted(inventory.comps[i].items()))
+
+
+def _brute_force(inventory, elements, bounds, target, allowance, max_types, prefer_overshoot):
+    # every count vector over the whole inventory using at most max_types kinds of item, scored
+    # like find_solutions and keyed by the count of each kind
+    over, under = (Fraction(1, 2), Fraction(2)) if prefer_overshoot else (Fraction(1), Fraction(1))
+    lo_total, hi_total = target - allowance, target + allowance
+    # the values the floats stand for: 0.2 means 1/5 and 0.666... means 2/3
+    def exact(x):
+        return Fraction(x).limit_denominator(10 ** 6)
+    masses = [exact(m) for m in inventory.masses]
+    comps = [{el: exact(c) for el, c in comp.items()} for comp in inventory.comps]
+    limits = {el: (exact(lo), exact(hi)) for el, (lo, hi) in bounds.items()}
+    found = {}
+    for counts in itertools.product(*[range(int(a) + 1) for a in inventory.available]):
+        used = [(i, c) for i, c in enumerate(counts) if c]
+        if not used or len({_kind(inventory, i) for i, _ in used}) > max_types:
+            continue
+        total = sum(c * masses[i] for i, c in used)
+        if not lo_total <= total <= hi_total:
+            continue
+        shares = {el: sum(c * masses[i] * comps[i].get(el, 0) for i, c in used) / total for el in elements}
+        if all(limits[el][0] <= shares[el] <= limits[el][1] for el in elements):
+            diff = total - target
+            found[_kind_counts(inventory, used)] = float(diff * over if diff >= 0 else -diff * under)
+    return found
+
+
+def _kind_counts(inventory, used):
+    totals = {}
+    for i, c in used:
+        totals[_kind(inventory, i)] = totals.get(_kind(inventory, i), 0) + c
+    return tuple(sorted(totals.items()))
+
+
+def _as_key(inventory, sol):
+    return _kind_counts(inventory, zip(sol['combo'], sol['counts']))
+
+
+@pytest.mark.parametrize('items, bounds, target, allowance, max_types', [
+    (BRONZE_ITEMS, BRONZE, 144, 36, 3),
+    (BRONZE_ITEMS, BRONZE, 200, 20, 4),
+    (BRASS_ITEMS, BRASS, 300, 50, 3),
+    (BRASS_ITEMS, BRASS, 250, 144, 4),
+    (ODD_ITEMS, ODD, 150, 25, 4),
+    (ODD_ITEMS, ODD, 100.5, 30.25, 3),
+])
+@pytest.mark.parametrize('prefer_overshoot', [True, False])
+def test_find_solutions_matches_brute_force(items, bounds, target, allowance, max_types, prefer_overshoot):
+    inventory, elements = _prepare(items, bounds)
+    expected = _brute_force(inventory, elements, bounds, target, allowance, max_types, prefer_overshoot)
+    assert expected
+
+    # with room for every candidate the search has to report exactly the brute-force set
+    solutions = alloy_calc.find_solutions(inventory, elements, bounds, target, allowance, max_types,
+                                          len(expected) + 10, prefer_overshoot)
+    got = {_as_key(inventory, sol): sol['score'] for sol in solutions}
+    assert len(got) == len(solutions)
+    assert got == pytest.approx(expected)
+
+    # a short list keeps the best scores, in order
+    top = min(5, len(expected))
+    best = alloy_calc.find_solutions(inventory, elements, bounds, target, allowance, max_types, top,
+                                     prefer_overshoot)
+    assert [sol['score'] for sol in best] == pytest.approx(sorted(expected.values())[:top])
+
+
+
+def test_find_solutions_splits_grouped_counts_most_plentiful_first():
+    inventory, elements = _prepare(BRONZE_ITEMS, BRONZE)
+    solutions = alloy_calc.find_solutions(inventory, elements, BRONZE, 200, 20, 4, 1000)
+    assert len({_as_key(inventory, sol) for sol in solutions}) == len(solutions)
+    nugget, native = inventory.names.index('Copper Nugget'), inventory.names.index('Native Copper')
+    split = [dict(zip(sol['combo'], sol['counts'])) for sol in solutions]
+    # Copper Nugget (6 available) is used up before Native Copper (2 available)
+    assert any(native in counts for counts in split)
+    assert all(counts.get(nugget) == 6 for counts in split if native in counts)
+    for sol, counts in zip(solutions, split):
+        assert sol['scarcity'] == pytest.approx(sum(c / inventory.available[i] for i, c in counts.items()))
+
+
+def _summary(solutions):
+    return [(sol['combo'], sol['counts'], sol['score'], sol['scarcity']) for sol in solutions]
+
+
+def test_find_solutions_workers_match_single_process():
+    inventory, elements = _prepare(BRONZE_ITEMS, BRONZE)
+    single = alloy_calc.find_solutions(inventory, elements, BRONZE, 200, 20, 4, 7)
+    pooled = alloy_calc.find_solutions(inventory, elements, BRONZE, 200, 20, 4, 7, workers=3)
+    assert _summary(pooled) == _summary(single)
+    # the in-process search leaves no inputs behind
+    assert alloy_calc._search_state == {}
+
+
+def test_find_solutions_rejects_empty_top():
+    inventory, elements = _prepare(BRONZE_ITEMS, BRONZE)
+    with pytest.raises(ValueError):
+        alloy_calc.find_solutions(inventory, elements, BRONZE, 144, 36, 3, 0)
+
+
+def test_main_rejects_empty_top(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['alloy_calc.py', '-t', '144', '--top', '0'])
+    with pytest.raises(SystemExit) as exc:
+        alloy_calc.main()
+    assert exc.value.code == 2
+    assert '--top must be at least 1' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('r', [1, 2, 3, 4])
+def test_covering_combinations_matches_itertools(r):
+    item_mask = np.array([1, 2, 3, 0, 4, 2, 1], dtype=np.uint64)
+    required_mask = np.uint64(3)
+    expected = [list(c) for c in itertools.combinations(range(len(item_mask)), r)
+                if np.bitwise_or.reduce(item_mask[list(c)]) & required_mask == required_mask]
+    assert alloy_calc.covering_combinations(item_mask, required_mask, r).tolist() == expected
+
+
+def test_parse_recipe_string():
+    assert alloy_calc.parse_recipe_string(' Cu:0.50-0.65; Zn : .2 - 0.30 ;') == {'Cu': (0.5, 0.65), 'Zn': (0.2, 0.3)}
+    assert alloy_calc.parse_recipe_string('') == {}
+
+
+@pytest.mark.parametrize('recipe', ['Cu', 'Cu:0.5', 'Cu:0.5-', 'Cu:a-b', 'Cu:0.5-0.6 Zn:0.1-0.2', 'Cu 0.5-0.6'])
+def test_parse_recipe_string_rejects_malformed_entries(recipe):
+    with pytest.raises(ValueError):
+        alloy_calc.parse_recipe_string(recipe)
+
+
+def _rewrite_keeping_mtime(path, text):
+    # stands in for a quick successive save on a filesystem with coarse timestamps
+    st = path.stat()
+    path.write_text(text)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def test_load_items_rereads_an_edited_file(tmp_path):
+    path = tmp_path / 'items.json'
+    path.write_text(json.dumps([{'name': 'Ore', 'mass_mb': 100, 'available': 3, 'composition': {'Cu': 2}}]))
+    assert alloy_calc.load_items(str(path)) == [{'name': 'Ore', 'mass': 100.0, 'available': 3, 'comp': {'Cu': 1.0}}]
+    # callers may extend the returned list without touching the cache
+    alloy_calc.load_items(str(path)).append({})
+    assert len(alloy_calc.load_items(str(path))) == 1
+
+    _rewrite_keeping_mtime(path, json.dumps([{'name': 'Ore', 'mass_mb': 100, 'available': 12, 'composition': {'Cu': 1}}]))
+    assert alloy_calc.load_items(str(path))[0]['available'] == 12
+
+
+def test_load_recipes_rereads_an_edited_file(tmp_path):
+    path = tmp_path / 'recipes.json'
+    path.write_text(json.dumps({'bronze': {'Cu': [0.7, 0.8], 'Sn': [0.2, 0.3]}}))
+    assert alloy_calc.load_recipes(str(path)) == {'bronze': {'Cu': [0.7, 0.8], 'Sn': [0.2, 0.3]}}
+
+    _rewrite_keeping_mtime(path, json.dumps({'brass': {'Cu': [0.6, 0.7], 'Zn': [0.3, 0.4]}}))
+    assert list(alloy_calc.load_recipes(str(path))) == ['brass']
+
+
+def test_integer_mass_scale():
+    assert alloy_calc.integer_mass_scale(np.array([144.0, 100.0])) == 1
+    assert alloy_calc.integer_mass_scale(np.array([144.0, 14.4, 7.25])) == 100
+    with pytest.warns(RuntimeWarning):
+        assert alloy_calc.integer_mass_scale(np.array([100 / 3])) == 10 ** 6
+
+
+@pytest.mark.parametrize('comp, bounds, found', [
+    # 0.666... must not pass for 0.66667 or 0.66666, which both round onto it at 1/COMP_SCALE
+    ({'Cu': 2 / 3, 'Zn': 1 / 3}, {'Cu': (0.66667, 0.7), 'Zn': (0.0, 1.0)}, False),
+    ({'Cu': 2 / 3, 'Zn': 1 / 3}, {'Cu': (0.5, 0.66666), 'Zn': (0.0, 1.0)}, False),
+    ({'Cu': 2 / 3, 'Zn': 1 / 3}, {'Cu': (0.66666, 0.66667), 'Zn': (0.0, 1.0)}, True),
+    # 0.123445 and 0.12345 both round half to even onto 0.1234
+    ({'Cu': 0.123445, 'Zn': 0.876555}, {'Cu': (0.12345, 1.0), 'Zn': (0.0, 1.0)}, False),
+    ({'Cu': 0.123445, 'Zn': 0.876555}, {'Cu': (0.12344, 0.12345), 'Zn': (0.0, 1.0)}, True),
+])
+def test_off_grid_compositions_keep_their_bounds(comp, bounds, found):
+    inventory, elements = _prepare([_item('Bit', 30, 5, comp)], bounds)
+    solutions = alloy_calc.find_solutions(inventory, elements, bounds, 90, 0, 1, 1)
+    assert bool(solutions) == found
+    if found:
+        assert solutions[0]['elem_mass'] == pytest.approx([90 * comp[el] for el in elements])
+
+
+def test_compiled_kernels_match_brute_force(monkeypatch):
+    pytest.importorskip('numba')
+    monkeypatch.setattr(alloy_calc, 'JIT_MIN_COMBOS', 0)
+    inventory, elements = _prepare(BRONZE_ITEMS, BRONZE)
+    expected = _brute_force(inventory, elements, BRONZE, 200, 20, 4, True)
+    solutions = alloy_calc.find_solutions(inventory, elements, BRONZE, 200, 20, 4, len(expected) + 10)
+    assert hasattr(alloy_calc._search_combo, 'py_func')
+    assert {_as_key(inventory, sol): sol['score'] for sol in solutions} == pytest.approx(expected)